@@ -17,22 +17,180 @@
 # -------------------------------------------------------------
 
 from __future__ import annotations
+import atexit
+import queue
 import sqlite3
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Set, Tuple
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from contextlib import contextmanager
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache, partial
+from itertools import compress, count, repeat
+from operator import contains
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+# ---------------------------
+# SENTENCIAS SQL
+# ---------------------------
+# Texto constante: sqlite3 reutiliza la sentencia ya preparada de su caché
+# (cached_statements) en lugar de volver a compilarla en cada llamada.
+
+_SQL_INSERT = "INSERT INTO productos (id, nombre, cantidad, precio_cents) VALUES (?, ?, ?, ?)"
+_SQL_DELETE = "DELETE FROM productos WHERE id = ?"
+_SQL_UPDATE_CANTIDAD = "UPDATE productos SET cantidad = ? WHERE id = ?"
+_SQL_UPDATE_PRECIO = "UPDATE productos SET precio_cents = ? WHERE id = ?"
+_SQL_UPDATE_NOMBRE = "UPDATE productos SET nombre = ? WHERE id = ?"
+_SQL_SELECT_TODOS = "SELECT id, nombre, cantidad, precio_cents FROM productos ORDER BY id"
+_SQL_SELECT_POR_NOMBRE = (
+    "SELECT id, nombre, cantidad, precio_cents FROM productos "
+    "WHERE nombre = ? COLLATE NOCASE ORDER BY id"
+)
+# Reserva de ids: bajo BEGIN IMMEDIATE se lee el mayor id ya usado (fila actual
+# o contador AUTOINCREMENT) y se adelanta el contador. Así otra instancia u
+# otro proceso (incluso con INSERT sin id) nunca recibe un id reservado.
+_SQL_ULTIMO_ID = (
+    "SELECT MAX("
+    "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'productos'), 0), "
+    "COALESCE((SELECT MAX(id) FROM productos), 0))"
+)
+_SQL_BORRAR_SECUENCIA = "DELETE FROM sqlite_sequence WHERE name = 'productos'"
+_SQL_FIJAR_SECUENCIA = "INSERT INTO sqlite_sequence (name, seq) VALUES ('productos', ?)"
+
+# El precio se guarda en centavos enteros (sin redondeos de coma flotante)
+_SQL_CREATE_TABLA = """CREATE TABLE IF NOT EXISTS {tabla} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nombre TEXT NOT NULL,
+                    cantidad INTEGER NOT NULL CHECK (cantidad >= 0),
+                    precio_cents INTEGER NOT NULL CHECK (precio_cents >= 0)
+                )"""
+
+# Migración de bases antiguas (columna 'precio' REAL -> 'precio_cents' INTEGER).
+# SQLite no permite cambiar el tipo de una columna: se copia a una tabla nueva
+# conservando ids y el contador AUTOINCREMENT (sqlite_sequence). La conversión
+# a centavos se hace en Python con _a_centavos (mismo redondeo que al insertar).
+_SQL_MIGRAR_LEER = "SELECT id, nombre, cantidad, precio FROM productos"
+_SQL_MIGRAR_COPIAR = (
+    "INSERT INTO productos_nueva (id, nombre, cantidad, precio_cents) VALUES (?, ?, ?, ?)"
+)
+_SQL_MIGRAR_RENOMBRAR = (
+    "DELETE FROM sqlite_sequence WHERE name = 'productos_nueva'",
+    "INSERT INTO sqlite_sequence (name, seq) "
+    "SELECT 'productos_nueva', seq FROM sqlite_sequence WHERE name = 'productos'",
+    "DROP TABLE productos",
+    "ALTER TABLE productos_nueva RENAME TO productos",
+)
+
+# Ajustes de rendimiento comunes a todas las conexiones:
+# - temp_store/cache_size/mmap_size: más trabajo en memoria al leer
+# - busy_timeout: espera (ms) en lugar de fallar si la DB está ocupada
+_SQL_PRAGMAS = """PRAGMA temp_store=MEMORY;
+                  PRAGMA cache_size=-20000;
+                  PRAGMA mmap_size=268435456;
+                  PRAGMA busy_timeout=5000;"""
+
+# Ventana (segundos) en la que el hilo escritor junta operaciones pendientes
+# para confirmarlas en una sola transacción
+_VENTANA_ESCRITOR = 0.01
+
+# Operación pendiente de escritura: (sql, parámetros). Si los parámetros son
+# una lista de tuplas se ejecuta con executemany.
+_Operacion = Tuple[str, Union[Tuple, List[Tuple]]]
+
+# Ids que se reservan de una vez en la DB y luego se reparten localmente, sin
+# esperar al hilo escritor en cada alta
+_BLOQUE_IDS = 64
+
+# Petición de ids al hilo escritor: (cuántos ids, futuro con el primero)
+_Reserva = Tuple[int, "Future[int]"]
+
+# ---------------------------
+# UTILIDADES
+# ---------------------------
+
+@lru_cache(maxsize=4096)
+def _normaliza(s: str) -> str:
+    # Memoizada: los nombres repetidos (índices, búsquedas) no vuelven a
+    # reservar una cadena nueva con strip().lower()
+    return s.strip().lower()
+
+def _a_int64(valor: int) -> int:
+    # Valida antes de encolar: SQLite (y las columnas array('q')) solo admiten
+    # enteros de 64 bits; el error llega a quien llama, no al hilo escritor
+    v = int(valor)
+    if not -(2 ** 63) <= v < 2 ** 63:
+        raise OverflowError("Python int too large to convert to SQLite INTEGER")
+    return v
+
+def _a_centavos(precio: float) -> int:
+    # Redondeo comercial (mitades hacia arriba) sobre el valor decimal que se
+    # ve al escribir el número: 0.125 -> 13 centavos, 2.675 -> 268
+    d = Decimal(repr(float(precio)))
+    if not d.is_finite():
+        raise ValueError("El precio debe ser un número finito.")
+    return _a_int64(int(d.scaleb(2).to_integral_value(rounding=ROUND_HALF_UP)))
+
+def _ngrams(s: str, n: int = 3) -> Set[str]:
+    # n-gramas (subcadenas de longitud n) de un nombre ya normalizado
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+def _escanear(nombres: List[str], q: str) -> List[int]:
+    # Posiciones de los nombres que contienen q. Todo el bucle corre en C
+    # (map/compress de itertools), sin ejecutar bytecode por cada elemento.
+    return list(compress(count(), map(contains, nombres, repeat(q))))
 
 # ---------------------------
 # MODELO
 # ---------------------------
 
-@dataclass
 class Producto:
-    id: Optional[int]  # None hasta que se inserta en DB
-    nombre: str
-    cantidad: int
-    precio: float
+    # __slots__ en lugar de @dataclass: sin __dict__ por instancia
+    # (menos memoria y acceso a atributos más rápido)
+    __slots__ = ("id", "nombre", "cantidad", "_cents")
+
+    def __init__(self, id: Optional[int], nombre: str, cantidad: int, precio: float) -> None:
+        self.id = id  # None hasta que se inserta en DB
+        self.nombre = nombre
+        self.cantidad = cantidad
+        self._cents = _a_centavos(precio)
+
+    @classmethod
+    def desde_centavos(cls, id: Optional[int], nombre: str, cantidad: int, cents: int) -> Producto:
+        # Construcción directa desde la DB/caché, sin pasar por float
+        p = cls.__new__(cls)
+        p.id = id
+        p.nombre = nombre
+        p.cantidad = cantidad
+        p._cents = cents
+        return p
+
+    @property
+    def precio(self) -> float:
+        return self._cents / 100
+
+    @precio.setter
+    def precio(self, valor: float) -> None:
+        self._cents = _a_centavos(valor)
+
+    @property
+    def precio_cents(self) -> int:
+        return self._cents
+
+    def __repr__(self) -> str:
+        return (
+            f"Producto(id={self.id!r}, nombre={self.nombre!r}, "
+            f"cantidad={self.cantidad!r}, precio={self.precio!r})"
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Producto):
+            return NotImplemented
+        return self.to_tuple() == other.to_tuple()
 
-    # Propiedades para validar entradas (getters/setters implícitos con dataclass)
+    # Setters con validación
     def set_cantidad(self, nueva_cantidad: int) -> None:
         if not isinstance(nueva_cantidad, int) or nueva_cantidad < 0:
             raise ValueError("La cantidad debe ser un entero >= 0.")
@@ -62,70 +220,410 @@ class Producto:
 class Inventario:
     def __init__(self, db_path: str = "inventario.db") -> None:
         self.db_path = db_path
-        # Conexión y configuración de la tabla
-        self.conn = sqlite3.connect(self.db_path)
+        # Conexión de escritura (única) y configuración de la tabla
+        # isolation_level=None: autocommit; las transacciones se abren de forma
+        # explícita (BEGIN IMMEDIATE / COMMIT) desde el hilo escritor.
+        # check_same_thread=False: se crea aquí pero la usa el hilo escritor.
+        self.conn = sqlite3.connect(
+            self.db_path, isolation_level=None, cached_statements=256, check_same_thread=False
+        )
+        # WAL + synchronous=NORMAL: evita un fsync por cada commit y permite
+        # lectores concurrentes mientras se escribe
+        self.conn.executescript(
+            "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;" + _SQL_PRAGMAS
+        )
+        self.conn.execute(_SQL_CREATE_TABLA.format(tabla="productos"))
+        self._migrar_precio_a_centavos()
+        # Índice case-insensitive por nombre para búsquedas exactas en SQL
+        # (cada entrada guarda además el rowid/id, ya ordenado)
         self.conn.execute(
-            """CREATE TABLE IF NOT EXISTS productos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nombre TEXT NOT NULL,
-                    cantidad INTEGER NOT NULL CHECK (cantidad >= 0),
-                    precio REAL NOT NULL CHECK (precio >= 0)
-                )"""
+            "CREATE INDEX IF NOT EXISTS idx_productos_nombre_nocase "
+            "ON productos (nombre COLLATE NOCASE)"
         )
-        self.conn.commit()
-
-        # Colecciones en memoria para operaciones rápidas
-        # - dict: O(1) promedio para acceso por id
-        self._productos_por_id: Dict[int, Producto] = {}
+        # Cursor de escritura reutilizado: Connection.execute() crea un cursor
+        # nuevo en cada llamada; así las operaciones CRUD se ahorran esa reserva
+        self._cur = self.conn.cursor()
+        # Profundidad de transacciones anidadas (0 = sin transacción abierta)
+        self._txn_depth = 0
+        # Operaciones acumuladas dentro de transaction() (None fuera de ella)
+        self._lote: Optional[List[_Operacion]] = None
+        # Cómo deshacer en la caché cada cambio hecho dentro de transaction()
+        # (None fuera de ella); permite descartar solo un nivel anidado
+        self._deshacer: Optional[List[Callable[[], None]]] = None
+        # Pool de conexiones de solo lectura (se crean bajo demanda con _read()).
+        # La URI se resuelve aquí, una vez: una ruta relativa se interpreta
+        # respecto al directorio actual al conectar, no al leer. Las bases en
+        # memoria/temporales ("" o ":memory:") son privadas de self.conn, así
+        # que en ellas se lee por esa conexión (None = sin pool).
+        self._uri_lectura: Optional[str] = (
+            None
+            if self.db_path in ("", ":memory:")
+            else Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        )
+        self._lectores: queue.Queue[sqlite3.Connection] = queue.Queue()
+        # Serializa el uso compartido de self.conn (hilo escritor / lecturas
+        # de respaldo cuando no hay pool)
+        self._lock_conn = threading.Lock()
+
+        # Colecciones en memoria para operaciones rápidas (Struct-of-Arrays):
+        # una columna contigua por atributo; la posición i describe un producto
+        self._ids = array("q")
+        self._nombres: List[str] = []
+        # - nombres ya normalizados, calculados una vez al insertar/renombrar
+        self._nombres_norm: List[str] = []
+        self._cantidad = array("q")
+        # - precio en centavos enteros
+        self._cents = array("q")
+        # - dict pos_by_id: id -> posición en las columnas, O(1) promedio
+        self._pos_by_id: Dict[int, int] = {}
+        # Las columnas se mantienen ordenadas por id (carga ORDER BY id y los
+        # ids nuevos siempre son mayores); solo un swap-pop rompe ese orden
+        self._orden_sucio = False
         # - dict nombre_idx: nombre normalizado -> set de ids (maneja duplicados de nombre)
         self._nombre_idx: Dict[str, Set[int]] = {}
+        # - dict trigram_idx: trigrama -> set de ids (índice invertido para subcadenas)
+        self._trigram_idx: Dict[str, Set[int]] = {}
 
         # Cargar DB a memoria
         self._cargar_desde_db()
 
+        # Hilo escritor: las operaciones CRUD actualizan la caché al momento y
+        # encolan su SQL; el hilo las confirma en segundo plano, por lotes
+        self._cola: queue.Queue[Union[List[_Operacion], _Reserva, None]] = queue.Queue()
+        self._error_escritor: Optional[Exception] = None
+        self._hilo_escritor = threading.Thread(target=self._drenar, daemon=True)
+        self._hilo_escritor.start()
+        # El hilo es daemon: si quien usa el inventario no llama a cerrar(),
+        # al salir del intérprete se vacía la cola igualmente
+        self._cerrado = False
+        atexit.register(self.cerrar)
+        # Bloque de ids ya reservados: [_id_siguiente, _id_limite)
+        self._id_siguiente = 0
+        self._id_limite = 0
+
+    def _migrar_precio_a_centavos(self) -> None:
+        columnas = {fila[1] for fila in self.conn.execute("PRAGMA table_info(productos)")}
+        if "precio_cents" in columnas:
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(_SQL_CREATE_TABLA.format(tabla="productos_nueva"))
+            filas = self.conn.execute(_SQL_MIGRAR_LEER)
+            self.conn.executemany(
+                _SQL_MIGRAR_COPIAR,
+                ((row[0], row[1], row[2], _a_centavos(row[3])) for row in filas),
+            )
+            filas.close()
+            for sql in _SQL_MIGRAR_RENOMBRAR:
+                self.conn.execute(sql)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
     # ---------------------------
     # Utilidades internas de índice
     # ---------------------------
-    def _normaliza(self, s: str) -> str:
-        return s.strip().lower()
+    def _producto(self, pos: int) -> Producto:
+        # Reconstruye un Producto solo al devolver resultados a quien llama
+        return Producto.desde_centavos(
+            self._ids[pos], self._nombres[pos], self._cantidad[pos], self._cents[pos]
+        )
 
-    def _indexar(self, p: Producto) -> None:
-        if p.id is None:
+    def _indexar(self, prod_id: int, nombre: str, cantidad: int, cents: int) -> None:
+        # Un id menor que el último (p. ej. al deshacer una baja) rompe el orden
+        if self._ids and prod_id < self._ids[-1]:
+            self._orden_sucio = True
+        self._pos_by_id[prod_id] = len(self._ids)
+        self._ids.append(prod_id)
+        self._nombres.append(nombre)
+        clave = _normaliza(nombre)
+        self._nombres_norm.append(clave)
+        self._cantidad.append(cantidad)
+        self._cents.append(cents)
+        self._nombre_idx.setdefault(clave, set()).add(prod_id)
+        self._indexar_trigramas(prod_id, clave)
+
+    def _indexar_trigramas(self, prod_id: int, clave: str) -> None:
+        for g in _ngrams(clave):
+            self._trigram_idx.setdefault(g, set()).add(prod_id)
+
+    def _desindexar_trigramas(self, prod_id: int, clave: str) -> None:
+        for g in _ngrams(clave):
+            ids = self._trigram_idx.get(g)
+            if ids is not None:
+                ids.discard(prod_id)
+                if not ids:
+                    del self._trigram_idx[g]
+
+    def _desindexar(self, prod_id: int) -> None:
+        pos = self._pos_by_id.pop(prod_id, None)
+        if pos is None:
             return
-        self._productos_por_id[p.id] = p
-        clave = self._normaliza(p.nombre)
-        if clave not in self._nombre_idx:
-            self._nombre_idx[clave] = set()
-        self._nombre_idx[clave].add(p.id)
-
-    def _desindexar(self, p: Producto) -> None:
-        if p.id is None:
-            return
-        self._productos_por_id.pop(p.id, None)
-        clave = self._normaliza(p.nombre)
-        if clave in self._nombre_idx:
-            self._nombre_idx[clave].discard(p.id)
-            if not self._nombre_idx[clave]:
-                self._nombre_idx.pop(clave, None)
-
-    def _reindexar_nombre(self, p: Producto, nombre_anterior: str) -> None:
+        clave = self._nombres_norm[pos]
+        ids = self._nombre_idx.get(clave)
+        if ids is not None:
+            ids.discard(prod_id)
+            if not ids:
+                del self._nombre_idx[clave]
+        self._desindexar_trigramas(prod_id, clave)
+        # Swap-pop: el último elemento ocupa el hueco y se recortan las columnas
+        ultimo = len(self._ids) - 1
+        if pos != ultimo:
+            movido = self._ids[ultimo]
+            self._ids[pos] = movido
+            self._nombres[pos] = self._nombres[ultimo]
+            self._nombres_norm[pos] = self._nombres_norm[ultimo]
+            self._cantidad[pos] = self._cantidad[ultimo]
+            self._cents[pos] = self._cents[ultimo]
+            self._pos_by_id[movido] = pos
+            self._orden_sucio = True
+        self._ids.pop()
+        self._nombres.pop()
+        self._nombres_norm.pop()
+        self._cantidad.pop()
+        self._cents.pop()
+
+    def _reindexar_nombre(self, prod_id: int, nombre_anterior: str) -> None:
         # Cuando cambia el nombre, actualizamos índices
-        if p.id is None:
+        clave_ant = _normaliza(nombre_anterior)
+        ids = self._nombre_idx.get(clave_ant)
+        if ids is not None:
+            ids.discard(prod_id)
+            if not ids:
+                del self._nombre_idx[clave_ant]
+        self._desindexar_trigramas(prod_id, clave_ant)
+        pos = self._pos_by_id[prod_id]
+        clave = _normaliza(self._nombres[pos])
+        self._nombres_norm[pos] = clave
+        self._nombre_idx.setdefault(clave, set()).add(prod_id)
+        self._indexar_trigramas(prod_id, clave)
+
+    def _renombrar(self, prod_id: int, nombre: str) -> None:
+        pos = self._pos_by_id[prod_id]
+        nombre_anterior = self._nombres[pos]
+        self._nombres[pos] = nombre
+        self._reindexar_nombre(prod_id, nombre_anterior)
+
+    def _fijar(self, columna: str, prod_id: int, valor: int) -> None:
+        # Restaura un valor de _cantidad/_cents; se busca la posición al
+        # deshacer porque un swap-pop o _reordenar() pueden haberla movido
+        getattr(self, columna)[self._pos_by_id[prod_id]] = valor
+
+    def _al_deshacer(self, deshacer: Callable[[], None]) -> None:
+        if self._deshacer is not None:
+            self._deshacer.append(deshacer)
+
+    def _reordenar(self) -> None:
+        # Restaura el orden por id de las columnas tras eliminaciones
+        orden = sorted(range(len(self._ids)), key=self._ids.__getitem__)
+        self._ids = array("q", [self._ids[i] for i in orden])
+        self._nombres = [self._nombres[i] for i in orden]
+        self._nombres_norm = [self._nombres_norm[i] for i in orden]
+        self._cantidad = array("q", [self._cantidad[i] for i in orden])
+        self._cents = array("q", [self._cents[i] for i in orden])
+        self._pos_by_id = {prod_id: pos for pos, prod_id in enumerate(self._ids)}
+        self._orden_sucio = False
+
+    # ---------------------------
+    # Conexiones de lectura
+    # ---------------------------
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        # Presta una conexión de solo lectura del pool; con WAL los lectores no
+        # bloquean al escritor ni entre sí. Solo ven datos ya confirmados.
+        if self._uri_lectura is None:
+            with self._lock_conn:
+                yield self.conn
             return
-        clave_ant = self._normaliza(nombre_anterior)
-        if clave_ant in self._nombre_idx:
-            self._nombre_idx[clave_ant].discard(p.id)
-            if not self._nombre_idx[clave_ant]:
-                self._nombre_idx.pop(clave_ant, None)
-        self._indexar(p)
+        try:
+            lector = self._lectores.get_nowait()
+        except queue.Empty:
+            lector = sqlite3.connect(
+                self._uri_lectura,
+                uri=True,
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            lector.executescript(_SQL_PRAGMAS)
+        try:
+            yield lector
+        finally:
+            self._lectores.put(lector)
+
+    # ---------------------------
+    # Escritura en segundo plano
+    # ---------------------------
+    def _drenar(self) -> None:
+        # Bucle del hilo escritor. Cada elemento de la cola es un grupo de
+        # operaciones que se aplica entero o no se aplica (SAVEPOINT), o una
+        # reserva de ids; lo que llega dentro de la ventana comparte un COMMIT.
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + _VENTANA_ESCRITOR
+            # Una reserva tiene a quien llama esperando y tras el centinela None
+            # no llega nada más: en ambos casos no se agota la ventana
+            while lote[-1] is not None and not isinstance(lote[-1], tuple):
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            reservas: List[Tuple[Future[int], int]] = []
+            self._lock_conn.acquire()
+            try:
+                self._cur.execute("BEGIN IMMEDIATE")
+                for grupo in lote:
+                    if grupo is None:
+                        continue
+                    self._cur.execute("SAVEPOINT grupo")
+                    if isinstance(grupo, tuple):
+                        n, futuro = grupo
+                        try:
+                            primero = self._cur.execute(_SQL_ULTIMO_ID).fetchone()[0] + 1
+                            self._cur.execute(_SQL_BORRAR_SECUENCIA)
+                            self._cur.execute(_SQL_FIJAR_SECUENCIA, (primero + n - 1,))
+                            reservas.append((futuro, primero))
+                        except Exception as e:
+                            self._cur.execute("ROLLBACK TO grupo")
+                            futuro.set_exception(e)
+                        self._cur.execute("RELEASE grupo")
+                        continue
+                    try:
+                        for sql, params in grupo:
+                            if isinstance(params, list):
+                                self._cur.executemany(sql, params)
+                            else:
+                                self._cur.execute(sql, params)
+                    except Exception as e:
+                        # Cualquier fallo (sqlite3.Error, OverflowError al enlazar
+                        # parámetros, ...) descarta solo este grupo
+                        self._cur.execute("ROLLBACK TO grupo")
+                        self._registrar_error(e)
+                    self._cur.execute("RELEASE grupo")
+                self._cur.execute("COMMIT")
+                # Los ids solo se entregan una vez confirmada la reserva
+                for futuro, primero in reservas:
+                    futuro.set_result(primero)
+            except Exception as e:
+                # Nunca dejar la transacción abierta: el hilo sigue atendiendo la cola
+                self._registrar_error(e)
+                if self.conn.in_transaction:
+                    try:
+                        self._cur.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        pass
+                for grupo in lote:
+                    if isinstance(grupo, tuple) and not grupo[1].done():
+                        grupo[1].set_exception(e)
+            finally:
+                self._lock_conn.release()
+                for _ in lote:
+                    self._cola.task_done()
+            if None in lote:
+                return
+
+    def _registrar_error(self, e: Exception) -> None:
+        # Se conserva el primer error hasta que sincronizar() lo entregue
+        if self._error_escritor is None:
+            self._error_escritor = e
+
+    def _reservar_ids(self, n: int) -> int:
+        # Pide al hilo escritor n ids consecutivos y espera al primero. Va por
+        # la cola aunque haya una transaction() abierta (no forma parte de ella).
+        if self._cerrado:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        futuro: Future[int] = Future()
+        self._cola.put((n, futuro))
+        return futuro.result()
+
+    def _tomar_ids(self, n: int) -> int:
+        # Reparte n ids consecutivos del bloque reservado; solo cuando no
+        # alcanza se reserva otro (lo que sobre del anterior queda sin usar)
+        if self._id_siguiente + n > self._id_limite:
+            tam = max(n, _BLOQUE_IDS)
+            self._id_siguiente = self._reservar_ids(tam)
+            self._id_limite = self._id_siguiente + tam
+        primero = self._id_siguiente
+        self._id_siguiente += n
+        return primero
+
+    def sincronizar(self) -> None:
+        # Espera a que el hilo escritor confirme todo lo encolado (no incluye
+        # lo acumulado en una transaction() abierta). Si la DB rechazó alguna
+        # operación, la caché se recarga y se propaga el error.
+        self._cola.join()
+        error, self._error_escritor = self._error_escritor, None
+        if error is not None:
+            if self._txn_depth == 0:
+                self._cargar_desde_db()
+            raise error
+
+    # ---------------------------
+    # Transacciones
+    # ---------------------------
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # Agrupa varias operaciones en una única transacción (un solo commit).
+        # Se puede anidar: solo la transacción más externa encola. Si un nivel
+        # falla se descarta solo lo hecho en él (como un SAVEPOINT): se recortan
+        # sus operaciones del lote y se deshacen sus cambios en la caché.
+        if self._txn_depth == 0:
+            self._lote = []
+            self._deshacer = []
+        marca_lote, marca_deshacer = len(self._lote), len(self._deshacer)
+        self._txn_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._txn_depth -= 1
+            del self._lote[marca_lote:]
+            while len(self._deshacer) > marca_deshacer:
+                self._deshacer.pop()()
+            if self._txn_depth == 0:
+                self._lote = None
+                self._deshacer = None
+            raise
+        else:
+            self._txn_depth -= 1
+            if self._txn_depth == 0:
+                lote, self._lote = self._lote, None
+                self._deshacer = None
+                if lote:
+                    self._cola.put(lote)
+
+    def _exec(self, sql: str, params: Union[Tuple, List[Tuple]] = ()) -> None:
+        # Fuera de transaction() cada operación se encola sola; dentro, se
+        # acumula y la transacción más externa la encola como un grupo.
+        # Los errores del hilo escritor se entregan en sincronizar()/cerrar().
+        if self._cerrado:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        if self._lote is not None:
+            self._lote.append((sql, params))
+        else:
+            self._cola.put([(sql, params)])
 
     def _cargar_desde_db(self) -> None:
-        self._productos_por_id.clear()
+        self._ids = array("q")
+        self._nombres = []
+        self._nombres_norm = []
+        self._cantidad = array("q")
+        self._cents = array("q")
+        self._pos_by_id.clear()
+        self._orden_sucio = False
         self._nombre_idx.clear()
-        cur = self.conn.execute("SELECT id, nombre, cantidad, precio FROM productos")
-        for row in cur.fetchall():
-            p = Producto(id=row[0], nombre=row[1], cantidad=row[2], precio=row[3])
-            self._indexar(p)
+        self._trigram_idx.clear()
+        with self._read() as lector:
+            cur = lector.cursor()
+            # Lectura por bloques: evita materializar toda la tabla de una vez
+            cur.arraysize = 1024
+            cur.execute(_SQL_SELECT_TODOS)
+            while filas := cur.fetchmany():
+                for row in filas:
+                    self._indexar(row[0], row[1], row[2], row[3])
+            cur.close()
 
     # ---------------------------
     # Operaciones CRUD
@@ -134,103 +632,180 @@ class Inventario:
         # Permite productos con el mismo nombre (se distinguen por id)
         if cantidad < 0 or precio < 0:
             raise ValueError("Cantidad y precio deben ser >= 0.")
-        cur = self.conn.execute(
-            "INSERT INTO productos (nombre, cantidad, precio) VALUES (?, ?, ?)",
-            (nombre.strip(), int(cantidad), float(precio)),
-        )
-        self.conn.commit()
-        nuevo_id = cur.lastrowid
-        p = Producto(id=nuevo_id, nombre=nombre.strip(), cantidad=int(cantidad), precio=float(precio))
-        self._indexar(p)
-        return p
+        # Conversión una sola vez; los mismos valores van a SQL y a la caché
+        n, c, cents = nombre.strip(), _a_int64(cantidad), _a_centavos(precio)
+        nuevo_id = self._tomar_ids(1)
+        self._exec(_SQL_INSERT, (nuevo_id, n, c, cents))
+        self._indexar(nuevo_id, n, c, cents)
+        self._al_deshacer(partial(self._desindexar, nuevo_id))
+        return Producto.desde_centavos(nuevo_id, n, c, cents)
+
+    def anadir_productos(self, items: Iterable[Tuple[str, int, float]]) -> List[Producto]:
+        # Inserción masiva: un solo executemany dentro de una única transacción
+        # (un commit/fsync para todo el lote en lugar de uno por producto)
+        datos: List[Tuple[str, int, int]] = []
+        for nombre, cantidad, precio in items:
+            if cantidad < 0 or precio < 0:
+                raise ValueError("Cantidad y precio deben ser >= 0.")
+            datos.append((nombre.strip(), _a_int64(cantidad), _a_centavos(precio)))
+        if not datos:
+            return []
+        primer_id = self._tomar_ids(len(datos))
+        filas = [(primer_id + i, *fila) for i, fila in enumerate(datos)]
+        with self.transaction():
+            self._exec(_SQL_INSERT, filas)
+        nuevos: List[Producto] = []
+        for prod_id, nombre, cantidad, cents in filas:
+            self._indexar(prod_id, nombre, cantidad, cents)
+            self._al_deshacer(partial(self._desindexar, prod_id))
+            nuevos.append(Producto.desde_centavos(prod_id, nombre, cantidad, cents))
+        return nuevos
 
     def eliminar_producto(self, prod_id: int) -> bool:
-        p = self._productos_por_id.get(prod_id)
-        if not p:
+        pos = self._pos_by_id.get(prod_id)
+        if pos is None:
             return False
-        self.conn.execute("DELETE FROM productos WHERE id = ?", (prod_id,))
-        self.conn.commit()
-        self._desindexar(p)
+        fila = (prod_id, self._nombres[pos], self._cantidad[pos], self._cents[pos])
+        self._exec(_SQL_DELETE, (prod_id,))
+        self._desindexar(prod_id)
+        self._al_deshacer(partial(self._indexar, *fila))
         return True
 
     def actualizar_cantidad(self, prod_id: int, nueva_cantidad: int) -> bool:
         if nueva_cantidad < 0:
             raise ValueError("La cantidad debe ser >= 0.")
-        p = self._productos_por_id.get(prod_id)
-        if not p:
+        pos = self._pos_by_id.get(prod_id)
+        if pos is None:
             return False
-        self.conn.execute("UPDATE productos SET cantidad = ? WHERE id = ?", (int(nueva_cantidad), prod_id))
-        self.conn.commit()
-        p.set_cantidad(int(nueva_cantidad))
+        c = _a_int64(nueva_cantidad)
+        self._exec(_SQL_UPDATE_CANTIDAD, (c, prod_id))
+        self._al_deshacer(partial(self._fijar, "_cantidad", prod_id, self._cantidad[pos]))
+        self._cantidad[pos] = c
         # Índices no cambian (mismo nombre)
         return True
 
     def actualizar_precio(self, prod_id: int, nuevo_precio: float) -> bool:
         if nuevo_precio < 0:
             raise ValueError("El precio debe ser >= 0.")
-        p = self._productos_por_id.get(prod_id)
-        if not p:
+        pos = self._pos_by_id.get(prod_id)
+        if pos is None:
             return False
-        self.conn.execute("UPDATE productos SET precio = ? WHERE id = ?", (float(nuevo_precio), prod_id))
-        self.conn.commit()
-        p.set_precio(float(nuevo_precio))
+        cents = _a_centavos(nuevo_precio)
+        self._exec(_SQL_UPDATE_PRECIO, (cents, prod_id))
+        self._al_deshacer(partial(self._fijar, "_cents", prod_id, self._cents[pos]))
+        self._cents[pos] = cents
         return True
 
     def actualizar_nombre(self, prod_id: int, nuevo_nombre: str) -> bool:
-        p = self._productos_por_id.get(prod_id)
-        if not p:
+        pos = self._pos_by_id.get(prod_id)
+        if pos is None:
             return False
-        nombre_anterior = p.nombre
-        self.conn.execute("UPDATE productos SET nombre = ? WHERE id = ?", (nuevo_nombre.strip(), prod_id))
-        self.conn.commit()
-        p.nombre = nuevo_nombre.strip()
-        self._reindexar_nombre(p, nombre_anterior)
+        n = nuevo_nombre.strip()
+        self._exec(_SQL_UPDATE_NOMBRE, (n, prod_id))
+        self._al_deshacer(partial(self._renombrar, prod_id, self._nombres[pos]))
+        self._renombrar(prod_id, n)
         return True
 
     # ---------------------------
     # Lecturas / Búsquedas
     # ---------------------------
     def obtener_por_id(self, prod_id: int) -> Optional[Producto]:
-        return self._productos_por_id.get(prod_id)
+        pos = self._pos_by_id.get(prod_id)
+        return None if pos is None else self._producto(pos)
 
     def buscar_por_nombre(self, consulta: str) -> List[Producto]:
         # Búsqueda flexible: primero por coincidencia exacta (índice),
-        # luego por subcadena case-insensitive (recorrido en memoria).
-        q = self._normaliza(consulta)
+        # luego por subcadena case-insensitive (índice de trigramas o recorrido).
+        q = _normaliza(consulta)
         encontrados: List[Producto] = []
         # Coincidencia exacta vía índice
         for prod_id in self._nombre_idx.get(q, set()):
-            encontrados.append(self._productos_por_id[prod_id])
-        # Coincidencia parcial (subcadena)
-        if not encontrados:
-            for p in self._productos_por_id.values():
-                if q in self._normaliza(p.nombre):
-                    encontrados.append(p)
+            encontrados.append(self._producto(self._pos_by_id[prod_id]))
+        if encontrados:
+            return encontrados
+        # Coincidencia parcial (subcadena). Los resultados salen en orden de
+        # posición: tras bajas (swap-pop) se restaura antes el orden por id
+        if self._orden_sucio:
+            self._reordenar()
+        if len(q) >= 3:
+            # Candidatos = intersección de las listas de ids de cada trigrama
+            # (empezando por la más corta); luego se verifica la subcadena.
+            postings = sorted((self._trigram_idx.get(g, set()) for g in _ngrams(q)), key=len)
+            candidatos = set(postings[0])
+            for ids in postings[1:]:
+                if not candidatos:
+                    break
+                candidatos &= ids
+            for pos in sorted(self._pos_by_id[i] for i in candidatos):
+                if q in self._nombres_norm[pos]:
+                    encontrados.append(self._producto(pos))
+        else:
+            # Consultas cortas: recorre la columna de nombres ya normalizados
+            for pos in _escanear(self._nombres_norm, q):
+                encontrados.append(self._producto(pos))
         return encontrados
 
+    def buscar_por_nombre_sql(self, consulta: str) -> List[Producto]:
+        # Coincidencia exacta resuelta por SQLite usando idx_productos_nombre_nocase,
+        # sin depender de la caché en memoria (NOCASE solo pliega letras ASCII).
+        # Lee de la DB: primero espera a que se confirmen las escrituras ya
+        # encoladas. Dentro de transaction() las operaciones de la transacción
+        # aún no se han encolado, así que esta consulta no las ve. Los errores
+        # del hilo escritor no se entregan aquí sino en sincronizar()/cerrar().
+        self._cola.join()
+        with self._read() as lector:
+            filas = lector.execute(_SQL_SELECT_POR_NOMBRE, (consulta.strip(),)).fetchall()
+        return [Producto.desde_centavos(row[0], row[1], row[2], row[3]) for row in filas]
+
     def listar_todos(self) -> List[Producto]:
-        # Devuelve una lista ordenada por id para visualización estable
-        return sorted(self._productos_por_id.values(), key=lambda p: p.id or 0)
+        # Devuelve una lista ordenada por id para visualización estable.
+        # Las columnas ya están en ese orden; solo se reordenan si hubo bajas.
+        if self._orden_sucio:
+            self._reordenar()
+        return [self._producto(pos) for pos in range(len(self._ids))]
 
     # ---------------------------
     # Cierre
     # ---------------------------
+    def __enter__(self) -> Inventario:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.cerrar()
+
     def cerrar(self) -> None:
+        if self._cerrado:
+            return
+        self._cerrado = True
+        atexit.unregister(self.cerrar)
+        # El centinela None detiene al hilo escritor tras vaciar la cola
+        self._cola.put(None)
+        self._hilo_escritor.join()
+        while not self._lectores.empty():
+            self._lectores.get_nowait().close()
+        self._cur.close()
         self.conn.close()
+        if self._error_escritor is not None:
+            raise self._error_escritor
 
 # ---------------------------
 # Interfaz de Usuario (Consola)
 # ---------------------------
 
+# Plantilla precompilada (método format ya enlazado) para cada línea de producto
+_FMT = "[ID {:03d}] {} | Cantidad: {} | Precio: ${:.2f}".format
+
 def imprimir_producto(p: Producto) -> None:
-    print(f"[ID {p.id:03d}] {p.nombre} | Cantidad: {p.cantidad} | Precio: ${p.precio:.2f}")
+    print(_FMT(p.id, p.nombre, p.cantidad, p.precio))
 
-def menu() -> None:
-    inv = Inventario()
-    print("=== Sistema Avanzado de Gestión de Inventario (SQLite) ===")
-    try:
-        while True:
-            print("""
+def imprimir_productos(productos: List[Producto]) -> None:
+    # Listados: se arma todo el texto y se escribe de una vez en lugar de un
+    # print() por producto
+    sys.stdout.write(
+        "\n".join([_FMT(p.id, p.nombre, p.cantidad, p.precio) for p in productos]) + "\n"
+    )
+
+_MENU = """
 ------------------------------
 1) Añadir producto
 2) Eliminar producto (por ID)
@@ -241,68 +816,93 @@ def menu() -> None:
 7) Mostrar todos
 0) Salir
 ------------------------------
-            """)
+            """
+
+def _menu_anadir(inv: Inventario) -> None:
+    nombre = input("Nombre: ").strip()
+    cantidad = int(input("Cantidad (entero >= 0): "))
+    precio = float(input("Precio (>= 0): "))
+    p = inv.anadir_producto(nombre, cantidad, precio)
+    print("✓ Producto añadido:")
+    imprimir_producto(p)
+
+def _menu_eliminar(inv: Inventario) -> None:
+    prod_id = int(input("ID del producto a eliminar: "))
+    ok = inv.eliminar_producto(prod_id)
+    print("✓ Eliminado" if ok else "✗ ID no encontrado")
+
+def _menu_actualizar_cantidad(inv: Inventario) -> None:
+    prod_id = int(input("ID del producto: "))
+    nueva = int(input("Nueva cantidad (>= 0): "))
+    ok = inv.actualizar_cantidad(prod_id, nueva)
+    print("✓ Actualizado" if ok else "✗ ID no encontrado")
+
+def _menu_actualizar_precio(inv: Inventario) -> None:
+    prod_id = int(input("ID del producto: "))
+    nuevo = float(input("Nuevo precio (>= 0): "))
+    ok = inv.actualizar_precio(prod_id, nuevo)
+    print("✓ Actualizado" if ok else "✗ ID no encontrado")
+
+def _menu_actualizar_nombre(inv: Inventario) -> None:
+    prod_id = int(input("ID del producto: "))
+    nuevo = input("Nuevo nombre: ").strip()
+    ok = inv.actualizar_nombre(prod_id, nuevo)
+    print("✓ Actualizado" if ok else "✗ ID no encontrado")
+
+def _menu_buscar(inv: Inventario) -> None:
+    consulta = input("Buscar por nombre: ").strip()
+    resultados = inv.buscar_por_nombre(consulta)
+    if resultados:
+        print(f"✓ {len(resultados)} producto(s) encontrados:")
+        imprimir_productos(resultados)
+    else:
+        print("✗ Sin coincidencias.")
+
+def _menu_mostrar(inv: Inventario) -> None:
+    productos = inv.listar_todos()
+    if not productos:
+        print("Inventario vacío.")
+    else:
+        imprimir_productos(productos)
+
+# Tabla de despacho: opción del menú -> manejador (un solo acceso a dict
+# en lugar de comparar la opción contra cada rama de un if/elif)
+_MANEJADORES: Dict[str, Callable[[Inventario], None]] = {
+    "1": _menu_anadir,
+    "2": _menu_eliminar,
+    "3": _menu_actualizar_cantidad,
+    "4": _menu_actualizar_precio,
+    "5": _menu_actualizar_nombre,
+    "6": _menu_buscar,
+    "7": _menu_mostrar,
+}
+
+def menu() -> None:
+    inv = Inventario()
+    print("=== Sistema Avanzado de Gestión de Inventario (SQLite) ===")
+    try:
+        while True:
+            print(_MENU)
             opcion = input("Elige una opción: ").strip()
 
-            try:
-                if opcion == "1":
-                    nombre = input("Nombre: ").strip()
-                    cantidad = int(input("Cantidad (entero >= 0): "))
-                    precio = float(input("Precio (>= 0): "))
-                    p = inv.anadir_producto(nombre, cantidad, precio)
-                    print("✓ Producto añadido:")
-                    imprimir_producto(p)
-
-                elif opcion == "2":
-                    prod_id = int(input("ID del producto a eliminar: "))
-                    ok = inv.eliminar_producto(prod_id)
-                    print("✓ Eliminado" if ok else "✗ ID no encontrado")
-
-                elif opcion == "3":
-                    prod_id = int(input("ID del producto: "))
-                    nueva = int(input("Nueva cantidad (>= 0): "))
-                    ok = inv.actualizar_cantidad(prod_id, nueva)
-                    print("✓ Actualizado" if ok else "✗ ID no encontrado")
-
-                elif opcion == "4":
-                    prod_id = int(input("ID del producto: "))
-                    nuevo = float(input("Nuevo precio (>= 0): "))
-                    ok = inv.actualizar_precio(prod_id, nuevo)
-                    print("✓ Actualizado" if ok else "✗ ID no encontrado")
-
-                elif opcion == "5":
-                    prod_id = int(input("ID del producto: "))
-                    nuevo = input("Nuevo nombre: ").strip()
-                    ok = inv.actualizar_nombre(prod_id, nuevo)
-                    print("✓ Actualizado" if ok else "✗ ID no encontrado")
-
-                elif opcion == "6":
-                    consulta = input("Buscar por nombre: ").strip()
-                    resultados = inv.buscar_por_nombre(consulta)
-                    if resultados:
-                        print(f"✓ {len(resultados)} producto(s) encontrados:")
-                        for p in resultados:
-                            imprimir_producto(p)
-                    else:
-                        print("✗ Sin coincidencias.")
-
-                elif opcion == "7":
-                    productos = inv.listar_todos()
-                    if not productos:
-                        print("Inventario vacío.")
-                    else:
-                        for p in productos:
-                            imprimir_producto(p)
-
-                elif opcion == "0":
-                    print("Hasta luego 👋")
-                    break
+            if opcion == "0":
+                print("Hasta luego 👋")
+                break
 
-                else:
-                    print("Opción inválida. Intenta de nuevo.")
+            manejador = _MANEJADORES.get(opcion)
+            if manejador is None:
+                print("Opción inválida. Intenta de nuevo.")
+                continue
 
+            try:
+                manejador(inv)
+                # Las escrituras se confirman en segundo plano: si la DB rechazó
+                # alguna, se informa aquí y la caché vuelve a reflejar la DB
+                inv.sincronizar()
             except ValueError as ve:
                 print(f"Entrada inválida: {ve}")
+            except sqlite3.Error as e:
+                print(f"Error de base de datos: {e}")
 
     finally:
         inv.cerrar()